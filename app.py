@@ -1,18 +1,29 @@
 # app.py
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status, Response
+from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
+from fastapi.responses import HTMLResponse, StreamingResponse
 import redis.asyncio as redis
 from redis import exceptions as redis_exceptions
-from typing import List, Optional, Dict, Any
+from redis.commands.core import AsyncScript
+from typing import List, Optional, Dict, Any, Tuple, AsyncIterator
 import json
-from datetime import datetime, timezone
+import orjson
+from datetime import datetime
 import logging
-from utils.data_models import Device, CommandPayload, CommandResponse
+from utils.data_models import (Device, DeviceBatchRequest, CommandPayload, CommandResponse, DEVICE_BATCH_ADAPTER,
+                               COMMAND_PAYLOAD_ADAPTER, utcnow)
 
 # Import application settings and the Settings class
 from config.app_config import get_app_settings, Settings
-from utils.redis_helper import get_device_data_from_redis
+from utils.redis_helper import (get_device_data_from_redis, get_devices_data_from_redis, get_all_devices_from_redis,
+                                iter_devices_from_redis, command_history_key)
+from utils.fast_models import DeviceFast, DEVICE_JSON_ENCODER
+from utils.ttl_cache import TTLCache
+from utils.command_log_batcher import CommandLogBatcher
+from utils.redis_scripts import (LIST_DEVICES_LUA, SEND_COMMAND_LUA, COMMAND_LOGGED, COMMAND_DEVICE_NOT_FOUND,
+                                 COMMAND_DEVICE_OFFLINE)
 
 # Initialize settings early
 settings: Settings = get_app_settings()
@@ -36,11 +47,16 @@ async def lifespan(app: FastAPI):
         # Example: raise SystemExit("Failed to initialize critical resources.") # This would stop the app
     yield
     """Clean up resources on shutdown, e.g., close Redis pool."""
-    global redis_connection_pool
+    global redis_connection_pool, redis_client
+    await command_log_batcher.close()  # Cancels commands still waiting for a batch
+    if redis_client:
+        await redis_client.aclose()
+        redis_client = None
     if redis_connection_pool:
         logger.info("Application shutdown sequence initiated: Closing Redis connection pool.")
         # For redis.asyncio.ConnectionPool, disconnect closes all connections in the pool.
         await redis_connection_pool.disconnect()
+        redis_connection_pool = None
         logger.info("Redis connection pool disconnected.")
 
 
@@ -50,28 +66,57 @@ app = FastAPI(
     version="0.1.0",
     description="A configurable service to simulate IoT devices with Redis, featuring connection pooling, "
                 "transactions, and robust error handling.",
-    lifespan=lifespan)
+    lifespan=lifespan,
+    # The schema and docs routes are registered below so /openapi.json can serve pre-serialized bytes
+    openapi_url=None,
+    docs_url=None,
+    redoc_url=None)
 
 # --- Redis Connection Pool ---
 redis_connection_pool: Optional[redis.ConnectionPool] = None
+# Single shared client bound to the pool; connections are borrowed and released per command by redis-py
+redis_client: Optional[redis.Redis] = None
+
+# --- Registered Lua Scripts (None when APP_REDIS_USE_SCRIPTS is disabled) ---
+list_devices_script: Optional[AsyncScript] = None
+send_command_script: Optional[AsyncScript] = None
+
+# Highest index kept by LTRIM on a device's command history, i.e. keep the last 100 commands
+COMMAND_HISTORY_MAX_INDEX = 99
+# Batches concurrent SEND_COMMAND_LUA calls into shared pipelines
+command_log_batcher = CommandLogBatcher()
 
 
 async def initialize_redis_pool():
     """Initializes the Redis connection pool."""
-    global redis_connection_pool
+    global redis_connection_pool, redis_client, list_devices_script, send_command_script
     if redis_connection_pool is None:
-        redis_url = settings.get_redis_url()
+        redis_url = settings.redis_url
         logger.info(
-            f"Initializing Redis connection pool for URL: {redis_url.replace(settings.REDIS_PASSWORD, '*****') if settings.REDIS_PASSWORD else redis_url} (max_connections: {settings.REDIS_MAX_CONNECTIONS})")
+            f"Initializing Redis connection pool for URL: {settings.redis_url_for_log} (protocol: RESP{settings.REDIS_PROTOCOL}, max_connections: {settings.REDIS_MAX_CONNECTIONS}, timeout: {settings.REDIS_POOL_TIMEOUT}s)")
         try:
-            redis_connection_pool = redis.ConnectionPool.from_url(
+            # Blocking pool: once max_connections are in use, callers wait up to REDIS_POOL_TIMEOUT
+            # for a free connection instead of failing immediately with "Too many connections".
+            # Idle connections are reused LIFO (released connections are appended to and popped from
+            # the tail of the available list), so a small working set of sockets stays hot.
+            redis_connection_pool = redis.BlockingConnectionPool.from_url(
                 redis_url,
                 decode_responses=True,
-                max_connections=settings.REDIS_MAX_CONNECTIONS
+                # hiredis (when installed) parses replies in C for either protocol version
+                protocol=settings.REDIS_PROTOCOL,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                timeout=settings.REDIS_POOL_TIMEOUT
             )
             # Test the connection pool by acquiring a connection and pinging
             async with redis.Redis(connection_pool=redis_connection_pool) as r_conn:
                 await r_conn.ping()
+                if settings.REDIS_USE_SCRIPTS:
+                    # Pre-load the scripts so requests hit EVALSHA directly; the script objects cache the SHA
+                    list_devices_script = r_conn.register_script(LIST_DEVICES_LUA)
+                    send_command_script = r_conn.register_script(SEND_COMMAND_LUA)
+                    await r_conn.script_load(LIST_DEVICES_LUA)
+                    await r_conn.script_load(SEND_COMMAND_LUA)
+            redis_client = redis.Redis(connection_pool=redis_connection_pool)
             logger.info("Redis connection pool initialized and tested successfully.")
         except redis_exceptions.ConnectionError as e:
             logger.error(f"Failed to connect to Redis and initialize pool: {e}")
@@ -86,57 +131,82 @@ async def initialize_redis_pool():
 
 async def get_redis_connection() -> redis.Redis:
     """
-    FastAPI dependency to get a Redis connection from the pool.
-    Raises HTTPException if the pool is not available or connection fails.
+    FastAPI dependency returning the shared Redis client.
+    Raises HTTPException if the pool is not available.
     """
-    if redis_connection_pool is None:
+    if redis_client is None:
         logger.error("Redis connection pool is not initialized.")
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Redis service is not available (pool not initialized)."
         )
+    return redis_client
+
+
+def _utcnow_iso() -> Tuple[datetime, str]:
+    """Return the current UTC time together with its ISO 8601 form, computed once."""
+    now = utcnow()
+    return now, now.isoformat()
+
+
+async def _fetch_all_devices(r: redis.Redis) -> List[DeviceFast]:
+    """Fetch all devices, through the listing Lua script when scripts are enabled."""
+    return await get_all_devices_from_redis(r, settings.REDIS_SCAN_COUNT, list_script=list_devices_script)
+
+
+# --- /devices Result Cache ---
+# Holds the serialized device list
+devices_cache: TTLCache[bytes] = TTLCache(settings.DEVICES_CACHE_TTL)
 
+
+def invalidate_devices_cache() -> None:
+    """Drop the cached device list so the next /devices request reads from Redis."""
+    devices_cache.invalidate()
+
+
+async def _fetch_all_devices_json(r: redis.Redis) -> bytes:
+    """Fetch all devices and serialize them to a JSON array in one msgspec call."""
+    return DEVICE_JSON_ENCODER.encode(await _fetch_all_devices(r))
+
+
+async def _stream_devices_json(first_page: Optional[List[DeviceFast]],
+                               pages: AsyncIterator[List[DeviceFast]]) -> AsyncIterator[bytes]:
+    """Yield the device list as a JSON array, serializing and sending one SCAN page of devices per chunk."""
+    if first_page is None:
+        yield b"[]"
+        return
+    yield b"[" + DEVICE_JSON_ENCODER.encode(first_page)[1:-1]
     try:
-        # Create a new client instance using the established pool.
-        # The client will borrow a connection from the pool.
-        r_client = redis.Redis(connection_pool=redis_connection_pool)
-        # Optionally, ping to ensure connection health, though pool should manage this.
-
-        yield r_client
-    except redis_exceptions.ConnectionError as e:
-        logger.error(f"Failed to get Redis connection from pool: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Could not connect to Redis: {e}"
-        )
-    finally:
-        # Ensure connection is released back to the pool
-        if 'r_client' in locals() and r_client:
-            await r_client.aclose()
+        async for page in pages:
+            yield b"," + DEVICE_JSON_ENCODER.encode(page)[1:-1]
+    except redis_exceptions.RedisError as e:
+        # Headers are already sent, so the client sees a truncated body rather than a 503
+        logger.error(f"Redis error while streaming devices: {e}")
+        raise
+    yield b"]"
 
 
 # --- API Endpoints ---
-@app.get("/devices", response_model=List[Device], summary="List all simulated devices")
+# response_model=None: the body is already serialized, so FastAPI skips re-validating it;
+# the schema is still documented through `responses`.
+@app.get("/devices", response_model=None, responses={200: {"model": List[Device]}},
+         summary="List all simulated devices")
 async def list_all_devices(r: redis.Redis = Depends(get_redis_connection)):
-    """ Lists all devices stored in Redis."""
-    device_ids = []
+    """
+    Lists all devices stored in Redis.
+    With the cache disabled the devices are fetched and sent one SCAN page at a time, so only one page is held
+    in memory. The first page is awaited before responding, so a Redis that is down still maps to a 503.
+    """
     try:
-        cursor = '0'
-        while cursor != 0:
-            cursor, keys = await r.scan(cursor=cursor, match="device:*", count=50)
-            for key in keys:
-                if not key.endswith(":commands"):
-                    parts = key.split(":", 1)
-                    if len(parts) == 2:
-                        device_ids.append(parts[1])
-        unique_device_ids = sorted(list(set(device_ids)))
-
-        devices_out = []
-        for device_id_str in unique_device_ids:
-            device_data = await get_device_data_from_redis(r, device_id_str)
-            if device_data:
-                devices_out.append(device_data)
-        return devices_out
+        if devices_cache.ttl <= 0:
+            # Always SCAN pages here: the listing script returns every device in one reply
+            pages = iter_devices_from_redis(r, settings.REDIS_SCAN_COUNT)
+            try:
+                first_page = await pages.__anext__()
+            except StopAsyncIteration:
+                first_page = None
+            return StreamingResponse(_stream_devices_json(first_page, pages), media_type="application/json")
+        return Response(content=await devices_cache.get(lambda: _fetch_all_devices_json(r)), media_type="application/json")
     except redis_exceptions.RedisError as e:
         logger.error(f"Redis error while listing devices: {e}")
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -146,7 +216,28 @@ async def list_all_devices(r: redis.Redis = Depends(get_redis_connection)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred.")
 
 
-@app.get("/devices/{device_id}", response_model=Device, summary="Get details of a specific device")
+# response_model=None: the helper already validated the batch, so it is dumped in one TypeAdapter call
+# instead of FastAPI validating it a second time; the schema is still documented through `responses`.
+@app.post("/devices:batch", response_model=None, responses={200: {"model": List[Optional[Device]]}},
+          summary="Get details of several devices at once")
+async def get_devices_batch(batch: DeviceBatchRequest, r: redis.Redis = Depends(get_redis_connection)):
+    """ Retrieves several devices in one call, in request order, with null for IDs that don't exist."""
+    try:
+        devices = await get_devices_data_from_redis(r, batch.ids)
+        return Response(content=DEVICE_BATCH_ADAPTER.dump_json(devices), media_type="application/json")
+    except redis_exceptions.RedisError as e:
+        logger.error(f"Redis error getting device batch: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Error communicating with data store.")
+    except Exception as e:
+        logger.error(f"Unexpected error in get_devices_batch: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred.")
+
+
+# response_model=None: the helper returns a trusted DeviceFast struct that msgspec encodes without
+# FastAPI validating it against the model; the schema is still documented through `responses`.
+@app.get("/devices/{device_id}", response_model=None, responses={200: {"model": Device}},
+         summary="Get details of a specific device")
 async def get_specific_device(device_id: str, r: redis.Redis = Depends(get_redis_connection)):
     """ Retrieves details of a specific device by its ID."""
     try:
@@ -156,7 +247,7 @@ async def get_specific_device(device_id: str, r: redis.Redis = Depends(get_redis
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Device with ID '{device_id}' not found"
             )
-        return device
+        return Response(content=DEVICE_JSON_ENCODER.encode(device), media_type="application/json")
     except HTTPException:
         # Re-raise HTTPExceptions to maintain proper status codes
         raise
@@ -170,46 +261,86 @@ async def get_specific_device(device_id: str, r: redis.Redis = Depends(get_redis
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred.")
 
 
-@app.post("/devices/{device_id}/command", response_model=CommandResponse, summary="Send a command to a device")
-async def send_device_command(device_id: str, command: Dict[str, Any], r: redis.Redis = Depends(get_redis_connection)):
+# --- Command Logging Strategies ---
+def _encode_command_entry(command_to_log: Dict[str, Any]) -> bytes:
+    """Encode a command history entry with orjson, falling back to json for values orjson rejects."""
+    try:
+        return orjson.dumps(command_to_log)
+    except orjson.JSONEncodeError:
+        # e.g. integers wider than 64 bits, which the stdlib encoder handles
+        return json.dumps(command_to_log).encode()
+
+
+async def _log_command_with_script(r: redis.Redis, device_id: str, encoded_command: bytes) -> str:
+    """
+    Check the device and log the command atomically with one EVALSHA. Concurrent commands are
+    group-committed: the batcher sends them together in one pipeline.
+    """
+    return await command_log_batcher.submit(r, send_command_script, device_id, encoded_command,
+                                            COMMAND_HISTORY_MAX_INDEX)
+
+
+async def _log_command_with_pipeline(r: redis.Redis, device_id: str, encoded_command: bytes) -> str:
+    """Check the device with HGETALL, then log the command with a pipelined LPUSH + LTRIM."""
+    device = await get_device_data_from_redis(r, device_id)
+    if device is None:
+        return COMMAND_DEVICE_NOT_FOUND
+    if not device.online:
+        return COMMAND_DEVICE_OFFLINE
+
+    history_key = command_history_key(device_id)
+    # Send LPUSH and LTRIM in one round trip; no MULTI/EXEC needed since a racing
+    # LTRIM only ever leaves the list briefly above its cap
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.lpush(history_key, encoded_command)
+        pipe.ltrim(history_key, 0, COMMAND_HISTORY_MAX_INDEX)
+        await pipe.execute()
+    return COMMAND_LOGGED
+
+
+# The body is read raw and validated with COMMAND_PAYLOAD_ADAPTER, so its schema is documented through openapi_extra
+@app.post("/devices/{device_id}/command", response_model=CommandResponse, summary="Send a command to a device",
+          openapi_extra={"requestBody": {
+              "required": True,
+              "content": {"application/json": {"schema": CommandPayload.model_json_schema()}}
+          }})
+async def send_device_command(device_id: str, request: Request, r: redis.Redis = Depends(get_redis_connection)):
     """ Sends a command to a specific device and logs the command in Redis.
         The command must match the CommandPayload model structure.
     """
     try:
-        parsed_command = CommandPayload(**command)
-    except Exception as e:  # PydanticValidationError
+        parsed_command = COMMAND_PAYLOAD_ADAPTER.validate_json(await request.body())
+    except Exception as e:  # PydanticValidationError, including malformed JSON
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid command structure: {str(e)}"
         )
 
     try:
-        device = await get_device_data_from_redis(r, device_id)
-        if device is None:
+        current_time, current_time_iso = _utcnow_iso()
+        command_to_log = {
+            "action": parsed_command.action,
+            "parameters": parsed_command.parameters,
+            "timestamp": current_time_iso
+        }
+        encoded_command = _encode_command_entry(command_to_log)
+
+        if send_command_script is not None:
+            outcome = await _log_command_with_script(r, device_id, encoded_command)
+        else:
+            outcome = await _log_command_with_pipeline(r, device_id, encoded_command)
+
+        if outcome == COMMAND_DEVICE_NOT_FOUND:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Device with ID '{device_id}' not found. Cannot send command."
             )
-        if not device.online:
+        if outcome == COMMAND_DEVICE_OFFLINE:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Device '{device_id}' is offline. Cannot send command."
             )
 
-        command_history_key = f"device:{device_id}:commands"
-        current_time = datetime.now(timezone.utc)
-        command_to_log = {
-            "action": parsed_command.action,
-            "parameters": parsed_command.parameters,
-            "timestamp": current_time.isoformat()
-        }
-
-        # Use a pipeline for atomic LPUSH and LTRIM
-        async with r.pipeline(transaction=True) as pipe:  # transaction=True enables MULTI/EXEC
-            await pipe.lpush(command_history_key, json.dumps(command_to_log))
-            await pipe.ltrim(command_history_key, 0, 99)  # Keep last 100 commands
-            await pipe.execute()  # Execute the transaction
-
         return CommandResponse(
             message="Command received, processed, and logged successfully.",
             device_id=device_id,
@@ -228,30 +359,79 @@ async def send_device_command(device_id: str, command: Dict[str, Any], r: redis.
 
 
 # --- Health Check Endpoint ---
+# Holds the status of the most recent Redis PING
+health_ping_cache: TTLCache[str] = TTLCache(settings.HEALTH_CHECK_CACHE_TTL)
+
+
+async def _ping_redis() -> str:
+    r = await get_redis_connection()  # Raises 503 if the pool is not initialized
+    try:
+        await r.ping()
+        return "healthy"
+    except redis_exceptions.RedisError as e:
+        logger.warning(f"Health check: Redis ping failed: {e}")
+        return "unhealthy"
+
+
+# Pre-encoded body up to the timestamp value for each redis_status; only the timestamp changes per request
+_HEALTH_BODY_PREFIXES: Dict[str, bytes] = {
+    redis_status: orjson.dumps({"application_status": "healthy", "redis_status": redis_status})[:-1] + b',"timestamp":"'
+    for redis_status in ("healthy", "unhealthy")
+}
+
+
 @app.get("/health", status_code=status.HTTP_200_OK, tags=["Management"])
-async def health_check(
-        r: Optional[redis.Redis] = Depends(get_redis_connection, use_cache=False)):  # use_cache=False for health checks
+async def health_check():
     """
     Provides a basic health check for the service, including for Redis connectivity.
+    The PING result is reused for HEALTH_CHECK_CACHE_TTL seconds so frequent liveness/readiness
+    probes don't each hit Redis, and the body is assembled from pre-encoded bytes.
     """
-    redis_status = "unavailable"
-    if r:  # Check if dependency provided a connection
-        try:
-            await r.ping()
-            redis_status = "healthy"
-        except redis_exceptions.RedisError as e:
-            logger.warning(f"Health check: Redis ping failed: {e}")
-            redis_status = "unhealthy"
-        # Connection is automatically closed by Depends on if 'r' was successfully yielded
+    redis_status = await health_ping_cache.get(_ping_redis)
+    body = _HEALTH_BODY_PREFIXES[redis_status] + _utcnow_iso()[1].encode() + b'"}'
+    return Response(content=body, media_type="application/json")
+
+
+# --- API Documentation ---
+OPENAPI_URL = "/openapi.json"
+# orjson-serialized OpenAPI schema per ASGI root_path, built on the first request once every route is registered
+_openapi_json_by_root_path: Dict[str, bytes] = {}
+
+
+def _root_path(request: Request) -> str:
+    return request.scope.get("root_path", "").rstrip("/")
+
+
+@app.get(OPENAPI_URL, include_in_schema=False)
+async def openapi_schema(request: Request) -> Response:
+    """Serves the OpenAPI schema, serializing it only once per root_path since routes don't change after startup."""
+    root_path = _root_path(request)
+    openapi_json = _openapi_json_by_root_path.get(root_path)
+    if openapi_json is None:
+        schema = app.openapi()
+        # Same as FastAPI's built-in handler: behind a proxy, list the root path as the first server
+        if root_path and app.root_path_in_servers:
+            server_urls = {server.get("url") for server in schema.get("servers", [])}
+            if root_path not in server_urls:
+                schema = dict(schema)
+                schema["servers"] = [{"url": root_path}] + schema.get("servers", [])
+        openapi_json = orjson.dumps(schema)
+        _openapi_json_by_root_path[root_path] = openapi_json
+    return Response(content=openapi_json, media_type="application/json")
+
+
+@app.get("/docs", include_in_schema=False)
+async def swagger_ui_html(request: Request) -> HTMLResponse:
+    return get_swagger_ui_html(openapi_url=_root_path(request) + OPENAPI_URL, title=f"{app.title} - Swagger UI")
+
 
-    return {
-        "application_status": "healthy",
-        "redis_status": redis_status,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    }
+@app.get("/redoc", include_in_schema=False)
+async def redoc_html(request: Request) -> HTMLResponse:
+    return get_redoc_html(openapi_url=_root_path(request) + OPENAPI_URL, title=f"{app.title} - ReDoc")
 
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
 
     # Get settings once at startup
@@ -262,5 +442,7 @@ if __name__ == "__main__":
         host=app_settings.API_HOST,
         port=app_settings.API_PORT,
         log_level=app_settings.LOG_LEVEL.lower(),
+        loop="uvloop" if sys.platform != "win32" else "asyncio",  # uvloop has no Windows support
+        http="httptools",
         reload=False  # Set to True during development
     )
@@ -2,7 +2,7 @@ import os
 from typing import Optional
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from functools import lru_cache
+from functools import lru_cache, cached_property
 
 
 class Settings(BaseSettings):
@@ -11,14 +11,23 @@ class Settings(BaseSettings):
     # API Settings
     API_HOST: str = Field("0.0.0.0", description="API host address")
     API_PORT: int = Field(8000, description="API port number")
+    DEVICES_BATCH_MAX_IDS: int = Field(1000, description="Maximum number of IDs accepted by one /devices:batch request")
 
     # Redis Connection Settings
     REDIS_HOST: str = Field("localhost", description="Redis host")
     REDIS_PORT: int = Field(6379, description="Redis port")
     REDIS_DB: int = Field(0, description="Redis database number")
     REDIS_PASSWORD: Optional[str] = Field(None, description="Redis password")
-    REDIS_MAX_CONNECTIONS: int = Field(10, description="Maximum number of Redis connections in pool")
+    REDIS_MAX_CONNECTIONS: int = Field(64, description="Maximum number of Redis connections in pool")
+    REDIS_POOL_TIMEOUT: float = Field(5.0, description="Seconds to wait for a free pooled connection before failing")
     REDIS_SSL: bool = Field(False, description="Whether to use SSL for Redis connection")
+    REDIS_PROTOCOL: int = Field(3, description="Redis serialization protocol version (2 = RESP2, 3 = RESP3, needs Redis 6+)")
+    REDIS_SCAN_COUNT: int = Field(10000, description="COUNT hint passed to SCAN when enumerating device keys")
+    REDIS_USE_SCRIPTS: bool = Field(True, description="Use server-side Lua scripts to fuse multi-step Redis operations")
+
+    # Caching Settings
+    DEVICES_CACHE_TTL: float = Field(1.0, description="Seconds to reuse the /devices result (0 disables caching)")
+    HEALTH_CHECK_CACHE_TTL: float = Field(0.5, description="Seconds to reuse the /health Redis PING result (0 disables caching)")
 
     # Logging Settings
     LOG_LEVEL: str = Field("info", description="Logging level (debug, info, warning, error, critical)")
@@ -38,6 +47,18 @@ class Settings(BaseSettings):
         else:
             return None
 
+    @cached_property
+    def redis_url(self) -> str:
+        """Redis URL, computed once per Settings instance."""
+        return self.get_redis_url()
+
+    @cached_property
+    def redis_url_for_log(self) -> str:
+        """Redis URL with the password masked, safe to write to logs."""
+        if self.REDIS_PASSWORD and self.redis_url:
+            return self.redis_url.replace(self.REDIS_PASSWORD, '*****')
+        return self.redis_url
+
     model_config = SettingsConfigDict(
         env_prefix="APP_",  # Environment variable prefix
         env_file=".env.example",  # Load from .env.example file
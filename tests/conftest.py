@@ -2,45 +2,119 @@
 import pytest
 import pytest_asyncio
 import redis.asyncio as redis_async
+import httpx
 from fastapi.testclient import TestClient
 import asyncio
+import os
+import uuid
 
-from app import app  # The FastAPI app instance
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
+
+# Under pytest-xdist each worker (gw0, gw1, ...) uses its own Redis logical DB. This must run before the app
+# is imported, since the app reads its (cached) settings at import time.
+_xdist_worker = os.environ.get("PYTEST_XDIST_WORKER")
+if _xdist_worker:
+    os.environ["APP_REDIS_DB"] = str(int(_xdist_worker[2:]) % 16)
+
+from app import app, invalidate_devices_cache  # The FastAPI app instance
+from utils import redis_helper
+from utils.redis_helper import device_key
 from config.app_config import get_app_settings  # Import settings to use for test Redis client
 
 settings = get_app_settings()  # Get settings for test configuration
 
 
-@pytest.fixture(scope="session")
-def event_loop(request):
-    """Create a new event loop for the test session."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
+# Loop pytest-asyncio creates for the session: uvloop when it is installed
+_LOOP_FACTORIES = {"uvloop": uvloop.new_event_loop} if uvloop else {"asyncio": asyncio.new_event_loop}
 
 
-@pytest_asyncio.fixture(scope="function")
-async def redis_client_fixture():
-    """Fixture for Redis client used in tests."""
+def pytest_asyncio_loop_factories(config, item):
+    """Loop factories pytest-asyncio uses for async tests and fixtures."""
+    return _LOOP_FACTORIES
+
+
+def pytest_generate_tests(metafunc):
+    """
+    pytest-asyncio only parametrizes async tests with the loop factory. Sync tests that use the async Redis
+    fixtures (the benchmarks) get the same parameter, so they reuse the session loop instead of tearing it down.
+    """
+    if "redis_session_client" in metafunc.fixturenames and not asyncio.iscoroutinefunction(metafunc.function):
+        metafunc.fixturenames.append("_asyncio_loop_factory")
+        metafunc.parametrize("_asyncio_loop_factory", list(_LOOP_FACTORIES.values()), ids=[pytest.HIDDEN_PARAM],
+                             indirect=True, scope="session")
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def redis_session_client():
+    """Redis client shared by the whole test session (one connection setup instead of one per test)."""
     # settings from config.py for the test Redis client
-    redis_url_for_tests = settings.get_redis_url()  # Uses configured host, port, db, password
+    redis_url_for_tests = settings.redis_url  # Uses configured host, port, db, password
 
     client = redis_async.from_url(redis_url_for_tests, decode_responses=True)
 
     await client.ping()
-    await client.flushdb()  # Clear DB before test
     yield client
-    await client.flushdb()  # Clear DB after test
     await client.aclose()  # Use aclose for async client
 
 
+@pytest_asyncio.fixture(scope="function")
+async def redis_client_fixture(redis_session_client: redis_async.Redis, monkeypatch):
+    """
+    Fixture for Redis client used in tests. Each test gets its own device key namespace, so it never sees
+    another test's devices, and only the keys it wrote are removed when it finishes.
+    Tests must build device keys with utils.redis_helper.device_key / command_history_key.
+    """
+    namespace = f"test:{uuid.uuid4().hex}"
+    monkeypatch.setattr(redis_helper, "DEVICE_KEY_PREFIX", f"{namespace}:device:")
+    invalidate_devices_cache()  # Don't serve a device list cached by a previous test
+    yield redis_session_client
+    # UNLINK frees memory in the background; one variadic call removes every key the test wrote
+    # A large COUNT hint walks the keyspace in a few SCAN round trips instead of ~10 keys per call
+    written_keys = [key async for key in redis_session_client.scan_iter(match=f"{namespace}:*",
+                                                                         count=settings.REDIS_SCAN_COUNT)]
+    if written_keys:
+        await redis_session_client.unlink(*written_keys)
+    invalidate_devices_cache()
+
+
 @pytest.fixture(scope="session", autouse=True)
 def test_app_client():
     """Create a TestClient for the FastAPI app."""
-    # TestClient will use the app instance which internally uses the configured settings
-    with TestClient(app) as client:
+    # TestClient will use the app instance which internally uses the configured settings.
+    # The app (and its Redis pool) runs on the TestClient's portal loop, so that is the loop to put on uvloop.
+    with TestClient(app, backend_options={"use_uvloop": uvloop is not None}) as client:
         yield client
 
+
+@pytest.fixture(scope="session")
+def async_test_app_client(test_app_client):
+    """
+    Create an httpx.AsyncClient that calls the app in-process over ASGITransport,
+    without the TestClient's thread hop per request.
+    The app's Redis pool lives on the TestClient's event loop, so coroutines using
+    this client must be run there via the run_on_app_loop fixture.
+    """
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+    yield client
+    test_app_client.portal.call(client.aclose)
+
+
+@pytest.fixture(scope="session")
+def openapi_schema(test_app_client):
+    """The app's OpenAPI schema, fetched and parsed once per session for the schema tests."""
+    response = test_app_client.get("/openapi.json")
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture(scope="session")
+def run_on_app_loop(test_app_client):
+    """Return a callable that runs an async function (with args) on the app's event loop and returns its result."""
+    return test_app_client.portal.call
+
 @pytest_asyncio.fixture(scope="function")
 async def online_device_fixture(redis_client_fixture: redis_async.Redis):
     """Fixture for an online device."""
@@ -51,7 +125,7 @@ async def online_device_fixture(redis_client_fixture: redis_async.Redis):
         "status": "active",
         "online": "true"
     }
-    await redis_client_fixture.hset(f"device:{device_id}", mapping=device_data_in_redis)
+    await redis_client_fixture.hset(device_key(device_id), mapping=device_data_in_redis)
     expected_api_data = {
         "id": device_id,
         "name": "Living Room Thermostat",
@@ -72,7 +146,7 @@ async def offline_device_fixture(redis_client_fixture: redis_async.Redis):
         "status": "inactive",
         "online": "false"
     }
-    await redis_client_fixture.hset(f"device:{device_id}", mapping=device_data_in_redis)
+    await redis_client_fixture.hset(device_key(device_id), mapping=device_data_in_redis)
     expected_api_data = {
         "id": device_id,
         "name": "Bedroom Lamp",
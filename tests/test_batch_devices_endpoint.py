@@ -0,0 +1,53 @@
+# tests/test_batch_devices_endpoint.py
+import pytest
+from fastapi import status
+from utils.data_models import Device
+from app import settings
+
+
+@pytest.mark.asyncio
+async def test_get_devices_batch_preserves_request_order(test_app_client, online_device_fixture,
+                                                         offline_device_fixture):
+    """Test that the batch endpoint returns devices in request order with null for missing IDs."""
+    ids = [offline_device_fixture["id"], "missing-dev-404", online_device_fixture["id"]]
+    response = test_app_client.post("/devices:batch", json={"ids": ids})
+
+    assert response.status_code == status.HTTP_200_OK
+    devices_response = response.json()
+    assert devices_response == [offline_device_fixture, None, online_device_fixture]
+    Device(**devices_response[0])
+
+
+@pytest.mark.asyncio
+async def test_get_devices_batch_empty_ids(test_app_client, redis_client_fixture):
+    """Test that an empty ID list returns an empty list."""
+    response = test_app_client.post("/devices:batch", json={"ids": []})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+
+
+def test_get_devices_batch_too_many_ids(test_app_client):
+    """Test that a batch longer than DEVICES_BATCH_MAX_IDS is rejected before touching Redis."""
+    max_ids = settings.DEVICES_BATCH_MAX_IDS
+    response = test_app_client.post("/devices:batch", json={"ids": [f"dev-{i}" for i in range(max_ids + 1)]})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+def test_get_devices_batch_invalid_body(test_app_client):
+    """Test that a body without an 'ids' list is rejected."""
+    response = test_app_client.post("/devices:batch", json={"devices": ["online-dev-001"]})
+    assert response.status_code == 422
+
+
+@pytest.mark.benchmark
+def test_benchmark_get_devices_batch(benchmark, async_test_app_client, run_on_app_loop, online_device_fixture,
+                                     offline_device_fixture):
+    """Benchmark retrieving several devices in one batch call."""
+    ids = [online_device_fixture["id"], offline_device_fixture["id"]]
+
+    async def target_api_call(client, device_ids):
+        response = await client.post("/devices:batch", json={"ids": device_ids})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == len(device_ids)
+
+    benchmark(run_on_app_loop, target_api_call, async_test_app_client, ids)
@@ -1,9 +1,11 @@
 # tests/test_command_device_endpoint.py
 import pytest
+import asyncio
 import json
 from fastapi import status
 from typing import Dict, Any, Optional
 from utils.data_models import CommandResponse
+from utils.redis_helper import device_key, command_history_key
 import redis.asyncio as redis_async_lib
 
 
@@ -23,7 +25,7 @@ async def test_send_command_to_online_device(test_app_client, online_device_fixt
     assert receipt_data["device_id"] == device_id
     assert receipt_data["action_performed"] == command_payload_dict["action"]
 
-    command_history_json = await redis_client_fixture.lrange(f"device:{device_id}:commands", 0, -1)
+    command_history_json = await redis_client_fixture.lrange(command_history_key(device_id), 0, -1)
     assert len(command_history_json) == 1
 
     stored_command = json.loads(command_history_json[0])
@@ -47,7 +49,7 @@ async def test_send_command_to_device_after_turning_online(
     assert response.json()["online"] == False
 
     # Turn the device online by updating Redis
-    await redis_client_fixture.hset(f"device:{device_id}", "online", "true")
+    await redis_client_fixture.hset(device_key(device_id), "online", "true")
 
     # Verify the device is now online
     response = test_app_client.get(f"/devices/{device_id}")
@@ -65,7 +67,7 @@ async def test_send_command_to_device_after_turning_online(
     assert receipt_data["action_performed"] == command_payload["action"]
 
     # Verify the command was logged in Redis
-    command_history_json = await redis_client_fixture.lrange(f"device:{device_id}:commands", 0, -1)
+    command_history_json = await redis_client_fixture.lrange(command_history_key(device_id), 0, -1)
     assert len(command_history_json) == 1
 
     stored_command = json.loads(command_history_json[0])
@@ -73,6 +75,22 @@ async def test_send_command_to_device_after_turning_online(
     assert stored_command["parameters"] == command_payload["parameters"]
 
 
+@pytest.mark.asyncio
+async def test_send_command_with_integer_wider_than_64_bits(test_app_client, online_device_fixture,
+                                                           redis_client_fixture: redis_async_lib.Redis):
+    """Test that a command with an integer orjson can't encode is still logged."""
+    device_id = online_device_fixture["id"]
+    big_value = 123456789012345678901234567890
+    command_payload = {"action": "set", "parameters": {"v": big_value}}
+
+    response = test_app_client.post(f"/devices/{device_id}/command", json=command_payload)
+    assert response.status_code == status.HTTP_200_OK
+
+    command_history_json = await redis_client_fixture.lrange(command_history_key(device_id), 0, -1)
+    assert len(command_history_json) == 1
+    assert json.loads(command_history_json[0])["parameters"]["v"] == big_value
+
+
 @pytest.mark.asyncio
 async def test_send_command_to_offline_device(test_app_client, offline_device_fixture):
     """Test sending a command to an offline device should return an error."""
@@ -85,6 +103,28 @@ async def test_send_command_to_offline_device(test_app_client, offline_device_fi
     assert response.json()["detail"] == f"Device '{device_id}' is offline. Cannot send command."
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("online_value, expected_status", [
+    ("True", status.HTTP_200_OK),
+    ("TRUE", status.HTTP_200_OK),
+    ("tRue", status.HTTP_400_BAD_REQUEST),
+    ("yes", status.HTTP_400_BAD_REQUEST),
+])
+async def test_send_command_online_flag_spellings(test_app_client, redis_client_fixture: redis_async_lib.Redis,
+                                                  online_value, expected_status):
+    """Test that the command path accepts the same "online" spellings as the device read path."""
+    device_id = "spelling-dev-001"
+    await redis_client_fixture.hset(device_key(device_id), mapping={
+        "name": "Hall Light", "type": "light", "status": "active", "online": online_value
+    })
+    reported_online = test_app_client.get(f"/devices/{device_id}").json()["online"]
+
+    response = test_app_client.post(f"/devices/{device_id}/command", json={"action": "toggle"})
+
+    assert response.status_code == expected_status
+    assert reported_online is (expected_status == status.HTTP_200_OK)
+
+
 @pytest.mark.asyncio
 async def test_send_command_to_non_existent_device(test_app_client, redis_client_fixture):
     """Test sending a command to a non-existent device should return a 404 error."""
@@ -107,23 +147,38 @@ async def test_command_with_invalid_structure(test_app_client, online_device_fix
     assert response.status_code == 400
 
 
+def test_concurrent_commands_get_their_own_outcome(async_test_app_client, run_on_app_loop, online_device_fixture,
+                                                   offline_device_fixture):
+    """Test that concurrent commands batched together still each get their device's own status code."""
+    targets = [online_device_fixture["id"], offline_device_fixture["id"], "ghost-device-404"] * 5
+
+    async def send_concurrently(client):
+        return await asyncio.gather(*(
+            client.post(f"/devices/{dev_id}/command", json={"action": "batched_action"}) for dev_id in targets
+        ))
+
+    responses = run_on_app_loop(send_concurrently, async_test_app_client)
+    expected_codes = [status.HTTP_200_OK, status.HTTP_400_BAD_REQUEST, status.HTTP_404_NOT_FOUND] * 5
+    assert [response.status_code for response in responses] == expected_codes
+
+
 @pytest.mark.benchmark
-def test_benchmark_send_command_to_device(benchmark, test_app_client, online_device_fixture):
+def test_benchmark_send_command_to_device(benchmark, async_test_app_client, run_on_app_loop, online_device_fixture):
     """Benchmark sending a command to an online device."""
     device_id = online_device_fixture["id"]
     command_payload = {"action": "benchmark_action", "parameters": {"value": 12345}}
 
-    def target_api_call(client, dev_id, payload):
-        response = client.post(f"/devices/{dev_id}/command", json=payload)
+    async def target_api_call(client, dev_id, payload):
+        response = await client.post(f"/devices/{dev_id}/command", json=payload)
         assert response.status_code == status.HTTP_200_OK
         assert response.json()["action_performed"] == payload["action"]
 
-    benchmark(target_api_call, test_app_client, device_id, command_payload)
+    benchmark(run_on_app_loop, target_api_call, async_test_app_client, device_id, command_payload)
 
 
 @pytest.mark.benchmark
-def test_benchmark_send_command_to_online_device_with_complex_payload(benchmark, test_app_client,
-                                                                      online_device_fixture):
+def test_benchmark_send_command_to_online_device_with_complex_payload(benchmark, async_test_app_client,
+                                                                      run_on_app_loop, online_device_fixture):
     """Benchmark sending a complex command to an online device."""
     device_id = online_device_fixture["id"]
     complex_payload = {
@@ -141,42 +196,39 @@ def test_benchmark_send_command_to_online_device_with_complex_payload(benchmark,
         }
     }
 
-    def target_api_call(client, dev_id, payload):
-        response = client.post(f"/devices/{dev_id}/command", json=payload)
+    async def target_api_call(client, dev_id, payload):
+        response = await client.post(f"/devices/{dev_id}/command", json=payload)
         assert response.status_code == status.HTTP_200_OK
         assert response.json()["action_performed"] == payload["action"]
 
-    benchmark(target_api_call, test_app_client, device_id, complex_payload)
+    benchmark(run_on_app_loop, target_api_call, async_test_app_client, device_id, complex_payload)
 
 
 @pytest.mark.benchmark
 @pytest.mark.asyncio
-async def test_benchmark_rapid_commands_sequence(benchmark, test_app_client, online_device_fixture,
-                                                 redis_client_fixture):
+async def test_benchmark_rapid_commands_sequence(benchmark, async_test_app_client, run_on_app_loop,
+                                                 online_device_fixture, redis_client_fixture):
     """Benchmark sending multiple commands in rapid succession to test handling of command history."""
     device_id = online_device_fixture["id"]
     command_payload = {"action": "simple_action", "parameters": {}}
 
-    def target_api_call(client, dev_id, payload):
-        # Send 20 commands in quick succession to test performance under load
-        responses = []
-        for i in range(20):
-            modified_payload = {
-                "action": f"{payload['action']}_{i}",
-                "parameters": {"sequence": i}
-            }
-            response = client.post(f"/devices/{dev_id}/command", json=modified_payload)
-            responses.append(response)
-
-        # Verify all responses were successful
+    async def target_api_call(client, dev_id, payload):
+        # Send 20 commands concurrently to test performance under load
+        responses = await asyncio.gather(*(
+            client.post(f"/devices/{dev_id}/command",
+                        json={"action": f"{payload['action']}_{i}", "parameters": {"sequence": i}})
+            for i in range(20)
+        ))
+
+        # Verify all responses were successful (gather preserves request order)
         for i, response in enumerate(responses):
             assert response.status_code == status.HTTP_200_OK
             assert response.json()["action_performed"] == f"{payload['action']}_{i}"
 
-    benchmark(target_api_call, test_app_client, device_id, command_payload)
+    benchmark(run_on_app_loop, target_api_call, async_test_app_client, device_id, command_payload)
 
     # Verify command history was properly maintained (outside of benchmark)
-    command_history = await redis_client_fixture.lrange(f"device:{device_id}:commands", 0, -1)
+    command_history = await redis_client_fixture.lrange(command_history_key(device_id), 0, -1)
     assert len(command_history) >= 20
 
 
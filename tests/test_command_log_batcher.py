@@ -0,0 +1,117 @@
+# tests/test_command_log_batcher.py
+import asyncio
+import pytest
+import redis.asyncio as redis_async_lib
+from redis.asyncio.client import Pipeline
+
+from utils.command_log_batcher import CommandLogBatcher
+from utils.redis_helper import command_history_key
+from utils.redis_scripts import SEND_COMMAND_LUA, COMMAND_LOGGED, COMMAND_DEVICE_OFFLINE, COMMAND_DEVICE_NOT_FOUND
+
+
+@pytest.fixture
+def pipeline_round_trips(monkeypatch):
+    """Record, per executed pipeline, how many commands it sent, plus any commands sent outside the batch."""
+    stats = {"batches": [], "immediate": []}
+    original_execute = Pipeline.execute
+    original_immediate = Pipeline.immediate_execute_command
+
+    async def counting_execute(self, *args, **kwargs):
+        stats["batches"].append(len(self.command_stack))
+        return await original_execute(self, *args, **kwargs)
+
+    async def counting_immediate(self, *args, **kwargs):
+        stats["immediate"].append(args[0])
+        return await original_immediate(self, *args, **kwargs)
+
+    monkeypatch.setattr(Pipeline, "execute", counting_execute)
+    monkeypatch.setattr(Pipeline, "immediate_execute_command", counting_immediate)
+    return stats
+
+
+async def _submit_concurrently(batcher, r, script, device_ids):
+    return await asyncio.gather(*(
+        batcher.submit(r, script, device_id, b'{"action": "batched"}', 99) for device_id in device_ids
+    ))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_commands_share_one_round_trip(redis_client_fixture: redis_async_lib.Redis,
+                                                        online_device_fixture, offline_device_fixture,
+                                                        pipeline_round_trips):
+    """Test that concurrently submitted commands go out as one pipeline, without a SCRIPT EXISTS round trip."""
+    script = redis_client_fixture.register_script(SEND_COMMAND_LUA)
+    await redis_client_fixture.script_load(SEND_COMMAND_LUA)
+    device_ids = [online_device_fixture["id"], offline_device_fixture["id"], "ghost-device-404"] * 3
+
+    outcomes = await _submit_concurrently(CommandLogBatcher(), redis_client_fixture, script, device_ids)
+
+    assert outcomes == [COMMAND_LOGGED, COMMAND_DEVICE_OFFLINE, COMMAND_DEVICE_NOT_FOUND] * 3
+    assert pipeline_round_trips["batches"] == [len(device_ids)]
+    assert pipeline_round_trips["immediate"] == []
+    assert await redis_client_fixture.llen(command_history_key(online_device_fixture["id"])) == 3
+
+
+@pytest.mark.asyncio
+async def test_batch_reloads_a_missing_script(redis_client_fixture: redis_async_lib.Redis, online_device_fixture,
+                                              pipeline_round_trips):
+    """Test that a batch whose script SHA is unknown to the server reloads the script and retries."""
+    script = redis_client_fixture.register_script(SEND_COMMAND_LUA)
+    real_sha = script.sha
+    script.sha = "0" * 40  # Not a loaded script, so the first pipeline gets NOSCRIPT replies
+    device_ids = [online_device_fixture["id"]] * 4
+
+    outcomes = await _submit_concurrently(CommandLogBatcher(), redis_client_fixture, script, device_ids)
+
+    assert outcomes == [COMMAND_LOGGED] * 4
+    assert script.sha == real_sha
+    assert pipeline_round_trips["batches"] == [4, 4]
+    assert await redis_client_fixture.llen(command_history_key(online_device_fixture["id"])) == 4
+
+
+@pytest.mark.asyncio
+async def test_submit_recovers_from_a_flusher_on_a_stopped_loop(redis_client_fixture: redis_async_lib.Redis,
+                                                                online_device_fixture):
+    """Test that a flusher left behind by a stopped loop doesn't make later submits hang."""
+    script = redis_client_fixture.register_script(SEND_COMMAND_LUA)
+    batcher = CommandLogBatcher()
+    other_loop = asyncio.new_event_loop()
+
+    async def leave_stale_flusher():
+        batcher._flusher = asyncio.create_task(asyncio.sleep(3600))
+        stale_future = asyncio.get_running_loop().create_future()
+        batcher._pending.append(("stale-device", b"{}", stale_future))
+        return stale_future
+
+    # The loop stops with the flusher still pending, as when a TestClient portal exits
+    stale_future = await asyncio.to_thread(other_loop.run_until_complete, leave_stale_flusher())
+    stale_flusher = batcher._flusher
+    try:
+        outcome = await asyncio.wait_for(
+            batcher.submit(redis_client_fixture, script, online_device_fixture["id"], b'{"action": "a"}', 99), 5)
+        assert outcome == COMMAND_LOGGED
+        assert stale_future.cancelled()
+    finally:
+        stale_flusher.cancel()
+        await asyncio.to_thread(other_loop.run_until_complete, asyncio.gather(stale_flusher, return_exceptions=True))
+        other_loop.close()
+
+
+@pytest.mark.asyncio
+async def test_close_cancels_pending_commands(redis_client_fixture: redis_async_lib.Redis, monkeypatch):
+    """Test that close() cancels the in-flight batch and the commands still waiting for one."""
+    script = redis_client_fixture.register_script(SEND_COMMAND_LUA)
+    batcher = CommandLogBatcher()
+
+    async def never_sent(*args, **kwargs):
+        await asyncio.Event().wait()
+    monkeypatch.setattr(batcher, "_send_batch", never_sent)
+
+    submits = [asyncio.create_task(batcher.submit(redis_client_fixture, script, f"dev-{i}", b"{}", 99))
+               for i in range(3)]
+    await asyncio.sleep(0)  # Let the flusher start sending the first batch
+    await batcher.close()
+
+    results = await asyncio.gather(*submits, return_exceptions=True)
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert batcher._flusher is None and batcher._pending == []
@@ -1,7 +1,15 @@
 # tests/test_devices_endpoint.py
 import pytest
 from fastapi import status
+from pydantic import TypeAdapter
+from typing import List
 from utils.data_models import Device
+import app as app_module
+from app import invalidate_devices_cache, settings
+from utils.redis_helper import device_key, command_history_key
+
+# Validates a whole /devices response in one call instead of one Device(**data) per item
+DEVICE_LIST_ADAPTER = TypeAdapter(List[Device])
 
 
 @pytest.mark.asyncio
@@ -27,24 +35,91 @@ async def test_get_devices_with_data(test_app_client, online_device_fixture, off
     assert offline_device_fixture["id"] in devices_map
     assert devices_map[offline_device_fixture["id"]] == offline_device_fixture
 
-    for device_data in devices_response:
-        Device(**device_data)
+    DEVICE_LIST_ADAPTER.validate_python(devices_response)  # Validates every row in one call
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(settings.DEVICES_CACHE_TTL <= 0, reason="/devices cache is disabled")
+async def test_get_devices_served_from_cache_until_invalidated(test_app_client, online_device_fixture,
+                                                               redis_client_fixture):
+    """Test that /devices reuses its cached result until the cache is invalidated."""
+    first_response = test_app_client.get("/devices")
+    assert first_response.status_code == status.HTTP_200_OK
+    assert len(first_response.json()) == 1
+
+    # Written straight to Redis, so the cached list doesn't know about it yet
+    await redis_client_fixture.hset(device_key("late-dev-003"), mapping={
+        "name": "Garage Door", "type": "door", "status": "active", "online": "true"
+    })
+    assert test_app_client.get("/devices").json() == first_response.json()
+
+    invalidate_devices_cache()
+    refreshed_ids = {d["id"] for d in test_app_client.get("/devices").json()}
+    assert refreshed_ids == {online_device_fixture["id"], "late-dev-003"}
+
+
+async def _write_devices(r, count: int, prefix: str) -> set:
+    """Write `count` online devices in one pipeline and return their IDs."""
+    device_ids = {f"{prefix}-{i}" for i in range(count)}
+    async with r.pipeline(transaction=False) as pipe:
+        for device_id in device_ids:
+            pipe.hset(device_key(device_id), mapping={
+                "name": f"Device {device_id}", "type": "sensor", "status": "active", "online": "true"
+            })
+        await pipe.execute()
+    return device_ids
+
+
+@pytest.mark.asyncio
+async def test_get_devices_streamed_in_chunks(test_app_client, redis_client_fixture, monkeypatch):
+    """Test that the uncached /devices stream joins many SCAN pages into one valid JSON array."""
+    monkeypatch.setattr(app_module.devices_cache, "ttl", 0)
+    monkeypatch.setattr(settings, "REDIS_SCAN_COUNT", 64)
+
+    async def fail_full_fetch(*args, **kwargs):
+        raise AssertionError("the stream must not build the full device list")
+    monkeypatch.setattr(app_module, "get_all_devices_from_redis", fail_full_fetch)
+    device_ids = await _write_devices(redis_client_fixture, 600, "stream-dev")
+
+    response = test_app_client.get("/devices")
+    assert response.status_code == status.HTTP_200_OK
+    returned_ids = [d["id"] for d in response.json()]
+    assert len(returned_ids) == len(device_ids)
+    assert set(returned_ids) == device_ids
+
+
+@pytest.mark.asyncio
+async def test_get_devices_with_scan_fallback(test_app_client, redis_client_fixture, monkeypatch):
+    """Test the SCAN + pipelined HGETALL path (no list script) across many small pages."""
+    monkeypatch.setattr(app_module, "list_devices_script", None)
+    monkeypatch.setattr(settings, "REDIS_SCAN_COUNT", 5)
+    device_ids = await _write_devices(redis_client_fixture, 60, "scan-dev")
+    # History lists share the device key prefix and must not show up as devices
+    for device_id in list(device_ids)[:10]:
+        await redis_client_fixture.lpush(command_history_key(device_id), b'{"action": "ping"}')
+    invalidate_devices_cache()
+
+    response = test_app_client.get("/devices")
+    assert response.status_code == status.HTTP_200_OK
+    returned_ids = [d["id"] for d in response.json()]
+    assert len(returned_ids) == len(device_ids)
+    assert set(returned_ids) == device_ids
 
 
 @pytest.mark.benchmark
-def test_benchmark_get_all_devices(benchmark, test_app_client):
+def test_benchmark_get_all_devices(benchmark, async_test_app_client, run_on_app_loop):
     """Benchmark for retrieving all devices."""
 
-    def target_api_call(client):
-        response = client.get("/devices")
+    async def target_api_call(client):
+        response = await client.get("/devices")
         assert response.status_code == status.HTTP_200_OK
 
-    benchmark(target_api_call, test_app_client)
+    benchmark(run_on_app_loop, target_api_call, async_test_app_client)
 
 
 @pytest.mark.asyncio
 @pytest.mark.benchmark
-async def test_benchmark_get_ten_devices(benchmark, test_app_client, redis_client_fixture):
+async def test_benchmark_get_ten_devices(benchmark, async_test_app_client, run_on_app_loop, redis_client_fixture):
     """Benchmark retrieving 10 devices."""
     # Setup 10 devices in Redis
     device_ids = []  # You collect IDs for potential explicit cleanup
@@ -62,21 +137,21 @@ async def test_benchmark_get_ten_devices(benchmark, test_app_client, redis_clien
             "online": "true" if i % 2 == 0 else "false"
         }
         # Store device in Redis - with await
-        await redis_client_fixture.hset(f"device:{device_id}", mapping=device_data_for_redis)
+        await redis_client_fixture.hset(device_key(device_id), mapping=device_data_for_redis)
         device_ids.append(device_id)  # Collect for explicit cleanup, if desired
 
     # The benchmark() fixture runs the target_api_call multiple times.
     # The setup above is performed once before these benchmark runs.
     # This is good because you're benchmarking the API call, not the setup.
     try:
-        def target_api_call(client):
-            response = client.get("/devices")
+        async def target_api_call(client):
+            response = await client.get("/devices")
             assert response.status_code == status.HTTP_200_OK
             devices = response.json()
             assert len(devices) == num_devices_to_create
             return response
 
         # Run benchmark
-        benchmark(target_api_call, test_app_client)
+        benchmark(run_on_app_loop, target_api_call, async_test_app_client)
     except Exception as e:
         pytest.fail(f"Benchmark failed: {e}")
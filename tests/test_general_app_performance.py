@@ -1,28 +1,31 @@
 import pytest
 from fastapi import status
+from utils.redis_helper import device_key
 
 
 import asyncio
 
 
 # high concurrency test
-@pytest.mark.asyncio
-async def test_high_concurrency(test_app_client, online_device_fixture):
+def test_high_concurrency(async_test_app_client, run_on_app_loop, online_device_fixture):
     """Test high concurrency by sending multiple commands to the same device."""
     device_id = online_device_fixture["id"]
     command_payload = {"action": "concurrent_action", "parameters": {"value": 123}}
 
-    async def send_request():
-        response = test_app_client.post(f"/devices/{device_id}/command", json=command_payload)
+    async def send_request(client):
+        response = await client.post(f"/devices/{device_id}/command", json=command_payload)
         assert response.status_code == status.HTTP_200_OK
 
-    tasks = [send_request() for _ in range(100)]  # Simulate 100 concurrent requests
-    await asyncio.gather(*tasks)
+    async def send_concurrently(client):
+        # The async client lets the 100 requests actually interleave on the app's event loop
+        await asyncio.gather(*(send_request(client) for _ in range(100)))  # Simulate 100 concurrent requests
+
+    run_on_app_loop(send_concurrently, async_test_app_client)
 
 
 # large payload test
 
-def test_large_payload(benchmark, test_app_client, online_device_fixture):
+def test_large_payload(benchmark, async_test_app_client, run_on_app_loop, online_device_fixture):
     """Benchmark sending a large payload to a device."""
     device_id = online_device_fixture["id"]
     large_payload = {
@@ -30,11 +33,11 @@ def test_large_payload(benchmark, test_app_client, online_device_fixture):
         "parameters": {"data": [{"key": f"value_{i}"} for i in range(100)]}
     }
 
-    def target_api_call(client, dev_id, payload):
-        response = client.post(f"/devices/{dev_id}/command", json=payload)
+    async def target_api_call(client, dev_id, payload):
+        response = await client.post(f"/devices/{dev_id}/command", json=payload)
         assert response.status_code == status.HTTP_200_OK
 
-    benchmark(target_api_call, test_app_client, device_id, large_payload)
+    benchmark(run_on_app_loop, target_api_call, async_test_app_client, device_id, large_payload)
 
 
 #database load test
@@ -49,7 +52,7 @@ async def test_large_database_load(redis_client_fixture, test_app_client):
             "status": "active",
             "online": "true"
         }
-        await redis_client_fixture.hset(f"device:device_{i}", mapping=device_data_in_redis)
+        await redis_client_fixture.hset(device_key(f"device_{i}"), mapping=device_data_in_redis)
 
     response = test_app_client.get("/devices")
     assert response.status_code == status.HTTP_200_OK
@@ -1,5 +1,7 @@
 import pytest
 from fastapi import status
+from fastapi.testclient import TestClient
+from app import app
 
 def test_health_check(test_app_client):
     """Test the health check endpoint."""
@@ -10,11 +12,9 @@ def test_health_check(test_app_client):
     assert data["redis_status"] == 'healthy'
 
 
-def test_openapi_schema(test_app_client):
+def test_openapi_schema(openapi_schema):
     """Test that the OpenAPI schema is correctly generated."""
-    response = test_app_client.get("/openapi.json")
-    assert response.status_code == status.HTTP_200_OK
-    schema = response.json()
+    schema = openapi_schema
 
     assert "openapi" in schema
     assert "info" in schema
@@ -27,12 +27,21 @@ def test_openapi_schema(test_app_client):
         assert path in schema["paths"]
 
 
-def test_openapi_schema_is_valid(test_app_client):
-    """Verify the OpenAPI schema is available and well-formed."""
-    response = test_app_client.get("/openapi.json")
-    assert response.status_code == status.HTTP_200_OK
+def test_openapi_and_docs_honor_root_path():
+    """Test that behind a proxy root_path the schema lists it as a server and the docs pages load the prefixed URL."""
+    proxied_client = TestClient(app, root_path="/proxy")
 
-    schema = response.json()
+    schema = proxied_client.get("/openapi.json").json()
+    assert schema["servers"][0] == {"url": "/proxy"}
+    for docs_url in ("/docs", "/redoc"):
+        response = proxied_client.get(docs_url)
+        assert response.status_code == status.HTTP_200_OK
+        assert "/proxy/openapi.json" in response.text
+
+
+def test_openapi_schema_is_valid(openapi_schema):
+    """Verify the OpenAPI schema is available and well-formed."""
+    schema = openapi_schema
     # Validate basic structure
     assert "openapi" in schema
     assert "paths" in schema
@@ -42,16 +51,16 @@ def test_openapi_schema_is_valid(test_app_client):
     assert schema["openapi"].startswith("3.1")
 
 
-def test_all_endpoints_documented(test_app_client):
+def test_all_endpoints_documented(openapi_schema):
     """Verify all application endpoints are documented in the OpenAPI schema."""
-    response = test_app_client.get("/openapi.json")
-    schema = response.json()
+    schema = openapi_schema
 
     # Define the endpoints your application should have
     expected_endpoints = {
         "/devices": ["get"],
         "/devices/{device_id}": ["get"],
         "/devices/{device_id}/command": ["post"],
+        "/devices:batch": ["post"],
         "/health": ["get"]
     }
 
@@ -68,11 +77,10 @@ def test_all_endpoints_documented(test_app_client):
     ("/devices/nonexistent-device", "get", 404),
     ("/health", "get", 200)
 ])
-def test_endpoint_response_matches_schema(test_app_client, online_device_fixture, endpoint, method, status_code):
+def test_endpoint_response_matches_schema(test_app_client, openapi_schema, online_device_fixture, endpoint, method,
+                                          status_code):
     """Test that endpoint responses match the schema defined in OpenAPI docs."""
-    # Get the OpenAPI schema
-    schema_response = test_app_client.get("/openapi.json")
-    schema = schema_response.json()
+    schema = openapi_schema
 
     # Replace placeholder parameters in the endpoint path
     if "{device_id}" in endpoint:
@@ -133,10 +141,9 @@ def test_endpoint_response_matches_schema(test_app_client, online_device_fixture
 
 
 
-def test_command_endpoint_validates_per_schema(test_app_client, online_device_fixture):
+def test_command_endpoint_validates_per_schema(test_app_client, openapi_schema, online_device_fixture):
     """Test that the command endpoint validates input according to schema."""
-    schema_response = test_app_client.get("/openapi.json")
-    schema = schema_response.json()
+    schema = openapi_schema
 
     # Get command endpoint schema
     command_path = f"/devices/{online_device_fixture['id']}/command"
@@ -1,8 +1,11 @@
 # tests/test_specific_device_endpoint.py
 import pytest
+import redis.asyncio as redis_async_lib
 from fastapi import status
 from typing import Dict, Any, Optional
 from utils.data_models import Device
+from utils.redis_helper import device_key
+import app as app_module
 
 
 @pytest.mark.asyncio
@@ -25,17 +28,40 @@ async def test_get_specific_device_not_found(test_app_client, redis_client_fixtu
     assert "not found" in response.json()["detail"].lower()
 
 
+@pytest.mark.asyncio
+async def test_get_specific_device_pool_exhausted(test_app_client, online_device_fixture):
+    """Test that timing out on a full connection pool returns a 503 rather than a 404."""
+    async def exhausted_redis_connection():
+        pool = redis_async_lib.BlockingConnectionPool(
+            max_connections=1, timeout=0.05, **app_module.redis_connection_pool.connection_kwargs
+        )
+        held_connection = await pool.get_connection()  # Takes the only connection, so the request must wait
+        try:
+            yield redis_async_lib.Redis(connection_pool=pool)
+        finally:
+            await pool.release(held_connection)
+            await pool.disconnect()
+
+    app_module.app.dependency_overrides[app_module.get_redis_connection] = exhausted_redis_connection
+    try:
+        response = test_app_client.get(f"/devices/{online_device_fixture['id']}")
+    finally:
+        del app_module.app.dependency_overrides[app_module.get_redis_connection]
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
 @pytest.mark.benchmark
-def test_benchmark_get_one_device(benchmark, test_app_client, online_device_fixture):
+def test_benchmark_get_one_device(benchmark, async_test_app_client, run_on_app_loop, online_device_fixture):
     """Benchmark retrieving a single specific device."""
     device_id = online_device_fixture["id"]
 
-    def target_api_call(client, dev_id):
-        response = client.get(f"/devices/{dev_id}")
+    async def target_api_call(client, dev_id):
+        response = await client.get(f"/devices/{dev_id}")
         assert response.status_code == status.HTTP_200_OK
         assert response.json()["id"] == dev_id
 
-    benchmark(target_api_call, test_app_client, device_id)
+    benchmark(run_on_app_loop, target_api_call, async_test_app_client, device_id)
 
 
 class TestGetDeviceEndpointParameterized:
@@ -63,7 +89,7 @@ class TestGetDeviceEndpointParameterized:
                 "status": "testing",
                 "online": "true"
             }
-            await redis_client_fixture.hset(f"device:{setup_id}", mapping=device_payload_for_redis)
+            await redis_client_fixture.hset(device_key(setup_id), mapping=device_payload_for_redis)
             if match_data:
                 expected_device_json = {
                     "id": setup_id,
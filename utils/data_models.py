@@ -1,10 +1,16 @@
 # models.py
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from datetime import datetime, timezone
-from typing import Dict, Any
+from functools import partial
+from typing import Dict, Any, List, Optional
+from config.app_config import get_app_settings
 
 """Data models for device management in endpoints."""
 
+# Current UTC time; as a partial it calls datetime.now(timezone.utc) with no lambda frame or attribute lookups
+utcnow = partial(datetime.now, timezone.utc)
+
+
 class DeviceBase(BaseModel):
     name: str = Field(..., json_schema_extra={"example": "Smart Thermostat"})
     type: str = Field(..., json_schema_extra={"example": "thermostat"})
@@ -16,11 +22,25 @@ class Device(DeviceBase):
     online: bool = Field(..., json_schema_extra={"example": True})
 
 
+# Validates and serializes a whole /devices:batch result (None for missing IDs) in one call each, instead of per item
+DEVICE_BATCH_ADAPTER = TypeAdapter(List[Optional[Device]])
+
+
+class DeviceBatchRequest(BaseModel):
+    # Bounded so one request can't queue an unbounded pipeline of HGETALLs and build an unbounded reply
+    ids: List[str] = Field(..., max_length=get_app_settings().DEVICES_BATCH_MAX_IDS,
+                           json_schema_extra={"example": ["device-001", "device-002"]})
+
+
 class CommandPayload(BaseModel):
     action: str = Field(..., json_schema_extra={"example": "set_temperature"})
     parameters: Dict[str, Any] = Field(default_factory=dict, json_schema_extra={"example": {"value": 25.0}})
 
 
+# Parses and validates a raw command request body in one pass, without building an intermediate dict
+COMMAND_PAYLOAD_ADAPTER = TypeAdapter(CommandPayload)
+
+
 class CommandReceipt(BaseModel):
     message: str = Field(..., json_schema_extra={"example": "Command sent successfully and logged."})
     device_id: str = Field(..., json_schema_extra={"example": "device-001"})
@@ -28,7 +48,7 @@ class CommandReceipt(BaseModel):
         "action": "set_brightness",
         "parameters": {"level": 80}
     }})
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc),)
+    timestamp: datetime = Field(default_factory=utcnow)
 
 
 class CommandResponse(BaseModel):
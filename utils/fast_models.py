@@ -0,0 +1,21 @@
+# utils/fast_models.py
+import msgspec
+
+"""msgspec models for the read-heavy device paths; the Pydantic models in data_models.py remain the API schema."""
+
+
+class DeviceFast(msgspec.Struct, gc=False):
+    """
+    Response-side mirror of data_models.Device, encoded by msgspec's C encoder.
+    Keep the field names, order and types in sync with Device. gc=False because instances only hold str/bool.
+    """
+    name: str
+    type: str
+    status: str
+    id: str
+    online: bool
+
+
+# Shared module-level encoder: its configuration is set up once instead of per call to msgspec.json.encode.
+# encode() still returns a new bytes object each time.
+DEVICE_JSON_ENCODER = msgspec.json.Encoder()
@@ -1,37 +1,173 @@
 # utils/redis_helpers.py
+import asyncio
 import redis.asyncio as redis
-from pydantic import ValidationError
 from redis import exceptions as redis_exceptions
-from typing import Optional
+from redis.commands.core import AsyncScript
+from typing import Optional, List, Dict, Tuple, AsyncIterator
 import logging  # Added for consistency
 
 # Import Device model from app.py.
-from utils.data_models import Device
+from utils.data_models import Device, DEVICE_BATCH_ADAPTER
+from utils.fast_models import DeviceFast
 
 logger = logging.getLogger(__name__)
 
+# Prefix of every device key; tests point it at a per-test namespace so they only clean up their own keys
+DEVICE_KEY_PREFIX = "device:"
 
-async def get_device_data_from_redis(r: redis.Redis, device_id: str) -> Optional[Device]:
-    """Fetch device data from Redis and return a Device instance."""
-    device_key = f"device:{device_id}"
+# Spellings of a true "online" flag; a set lookup avoids allocating a lowercased copy per device.
+# Replies are decoded to str (decode_responses=True), so no bytes variants are needed.
+# SEND_COMMAND_LUA checks the same spellings; keep the two in sync.
+_ONLINE_TRUE_VALUES = frozenset(("true", "True", "TRUE"))
+
+
+def device_key(device_id: str) -> str:
+    """Return the key of the hash holding a device's data."""
+    return f"{DEVICE_KEY_PREFIX}{device_id}"
+
+
+def command_history_key(device_id: str) -> str:
+    """Return the key of the list holding a device's command history."""
+    return f"{DEVICE_KEY_PREFIX}{device_id}:commands"
+
+
+def device_id_from_key(key: str) -> str:
+    """Return the device ID part of a device hash key."""
+    return key[len(DEVICE_KEY_PREFIX):]
+
+
+def _device_fields_from_redis_hash(device_id: str, raw_data: dict) -> dict:
+    """Convert the raw (string-valued) hash stored in Redis, in place, into Device field values."""
+    raw_data["online"] = raw_data.get("online", "false") in _ONLINE_TRUE_VALUES
+    raw_data["id"] = device_id
+    return raw_data
+
+
+def device_struct_from_redis_hash(device_id: str, raw_data: dict) -> DeviceFast:
+    """
+    Shape the raw hash stored in Redis as a DeviceFast response struct, without a Pydantic model.
+    The hashes are written by this service, so the fields are trusted and not validated.
+    """
+    return DeviceFast(
+        name=raw_data["name"],
+        type=raw_data["type"],
+        status=raw_data.get("status", "active"),
+        id=device_id,
+        online=raw_data.get("online", "false") in _ONLINE_TRUE_VALUES,
+    )
+
+
+async def get_device_data_from_redis(r: redis.Redis, device_id: str) -> Optional[DeviceFast]:
+    """Fetch device data from Redis and return it as a DeviceFast struct."""
+    key = device_key(device_id)
     try:
-        raw_data = await r.hgetall(device_key)
+        raw_data = await r.hgetall(key)
         if not raw_data:
             return None
 
-        raw_data["online"] = raw_data.get("online", "false").lower() == "true"
-        raw_data["id"] = device_id
-
-        device_instance = Device(**raw_data)
-        return device_instance
-    except redis_exceptions.ConnectionError as e:
-        logger.error(f"Redis error fetching data for device {device_id} from key {device_key}: {e}")
-        # Depending on policy, could re-raise a custom app exception or return None
-        return None
-    except ValidationError as e:
-        logger.error(f"Data validation error for device {device_id} (key: {device_key}): {e}. Raw data: {raw_data}")
-        raise  # Re-raise ValidationError to be handled by the endpoint, possibly as a 500 or a specific 400/422
-    except Exception as e:  # Catch Pydantic validation errors or other unexpected issues
+        return device_struct_from_redis_hash(device_id, raw_data)
+    except redis_exceptions.RedisError as e:
+        # Includes BlockingConnectionPool timeouts ("No connection available."); the endpoints map these to a 503,
+        # so an unreachable or exhausted store is not reported as a missing device
+        logger.error(f"Redis error fetching data for device {device_id} from key {key}: {e}")
+        raise
+    except KeyError as e:
+        logger.error(f"Device {device_id} (key: {key}) is missing required field {e}. Raw data: {raw_data}")
+        raise  # Re-raise KeyError to be handled by the endpoint as a 500
+    except Exception as e:  # Catch other unexpected parsing issues
         logger.error(
-            f"Error parsing data for device {device_id} (key: {device_key}): {e}. Raw data: {raw_data if 'raw_data' in locals() else 'N/A'}")
+            f"Error parsing data for device {device_id} (key: {key}): {e}. Raw data: {raw_data if 'raw_data' in locals() else 'N/A'}")
         raise RuntimeError(f"Unexpected parsing error for device {device_id}") from e
+
+
+async def get_devices_data_from_redis(r: redis.Redis, device_ids: List[str]) -> List[Optional[Device]]:
+    """Fetch several devices with one pipelined round trip, returning None for IDs that don't exist."""
+    async with r.pipeline(transaction=False) as pipe:
+        for device_id in device_ids:
+            pipe.hgetall(device_key(device_id))
+        raw_devices = await pipe.execute()
+
+    # Validate the whole batch in one TypeAdapter call instead of one Device(**data) per ID
+    return DEVICE_BATCH_ADAPTER.validate_python(
+        [_device_fields_from_redis_hash(device_id, raw_data) if raw_data else None
+         for device_id, raw_data in zip(device_ids, raw_devices)])
+
+
+async def _get_device_hashes_with_script(r: redis.Redis, list_script: AsyncScript,
+                                         scan_count: int) -> Dict[str, dict]:
+    """Fetch every device hash with one EVALSHA that runs SCAN + HGETALL on the server."""
+    reply = await list_script(args=[f"{DEVICE_KEY_PREFIX}*", scan_count], client=r)
+    raw_by_id = {}  # Keyed by device ID, which also drops keys SCAN returns more than once
+    for key, fields in zip(reply[::2], reply[1::2]):
+        raw_by_id[device_id_from_key(key)] = dict(zip(fields[::2], fields[1::2]))
+    return raw_by_id
+
+
+async def _iter_device_hash_pages(r: redis.Redis, scan_count: int) -> AsyncIterator[List[Tuple[str, dict]]]:
+    """
+    Yield (device_id, raw hash) pairs one client-side SCAN page at a time, with one pipelined batch of HGETALLs
+    per page. The next SCAN call is issued before the current page's pipeline, so the two round trips overlap.
+    Empty pages are skipped. Keys SCAN returns more than once are not filtered out here.
+    """
+    async def scan_page(cursor: int):
+        # TYPE hash filters out the command history lists on the server
+        return await r.scan(cursor=cursor, match=f"{DEVICE_KEY_PREFIX}*", count=scan_count, _type="hash")
+
+    cursor, keys = await scan_page(0)
+    while True:
+        next_page = asyncio.create_task(scan_page(cursor)) if cursor != 0 else None
+        try:
+            if keys:
+                async with r.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        pipe.hgetall(key)
+                    raw_devices = await pipe.execute()
+                # Key may have been deleted between SCAN and HGETALL
+                page = [(device_id_from_key(key), raw_data) for key, raw_data in zip(keys, raw_devices) if raw_data]
+                if page:
+                    yield page
+        except BaseException:  # Including GeneratorExit when the consumer stops early
+            if next_page is not None:
+                next_page.cancel()
+            raise
+        if next_page is None:
+            break
+        cursor, keys = await next_page
+
+
+async def _get_device_hashes_with_scan(r: redis.Redis, scan_count: int) -> Dict[str, dict]:
+    """Fetch every device hash with client-side SCAN pages and pipelined HGETALLs."""
+    raw_by_id = {}  # Keyed by device ID, which also drops keys SCAN returns more than once
+    async for page in _iter_device_hash_pages(r, scan_count):
+        raw_by_id.update(page)
+    return raw_by_id
+
+
+async def get_all_devices_from_redis(r: redis.Redis, scan_count: int,
+                                     list_script: Optional[AsyncScript] = None) -> List[DeviceFast]:
+    """
+    Fetch every device in O(1) round trips: one EVALSHA of list_script when given, otherwise
+    client-side SCAN pages with pipelined HGETALLs. Devices are returned as DeviceFast structs.
+    """
+    if list_script is not None:
+        raw_by_id = await _get_device_hashes_with_script(r, list_script, scan_count)
+    else:
+        raw_by_id = await _get_device_hashes_with_scan(r, scan_count)
+    # Dict order is SCAN order; the API doesn't promise any ordering, so skip the O(N log N) sort
+    return [device_struct_from_redis_hash(device_id, raw_data) for device_id, raw_data in raw_by_id.items()]
+
+
+async def iter_devices_from_redis(r: redis.Redis, scan_count: int) -> AsyncIterator[List[DeviceFast]]:
+    """
+    Yield every device as DeviceFast structs, one non-empty SCAN page (about scan_count keys) at a time,
+    so callers only hold one page of devices in memory. Each device is yielded once.
+    """
+    seen_ids = set()  # IDs only, so memory per device stays far below a DeviceFast plus its raw hash
+    async for page in _iter_device_hash_pages(r, scan_count):
+        devices = []
+        for device_id, raw_data in page:
+            if device_id not in seen_ids:
+                seen_ids.add(device_id)
+                devices.append(device_struct_from_redis_hash(device_id, raw_data))
+        if devices:
+            yield devices
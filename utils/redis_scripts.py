@@ -0,0 +1,44 @@
+# utils/redis_scripts.py
+"""Server-side Lua scripts that fuse multi-step Redis operations into a single round trip."""
+
+# Walks the whole SCAN cursor on the server and returns a flat reply of
+# [key1, [field, value, ...], key2, [field, value, ...], ...] for every device hash.
+# ARGV[1] = MATCH pattern, ARGV[2] = COUNT hint. TYPE hash skips the command-history lists.
+LIST_DEVICES_LUA = """
+local cursor = "0"
+local out = {}
+repeat
+    local page = redis.call('SCAN', cursor, 'MATCH', ARGV[1], 'COUNT', ARGV[2], 'TYPE', 'hash')
+    cursor = page[1]
+    for _, key in ipairs(page[2]) do
+        out[#out + 1] = key
+        out[#out + 1] = redis.call('HGETALL', key)
+    end
+until cursor == "0"
+return out
+"""
+
+# Outcomes returned by SEND_COMMAND_LUA
+COMMAND_LOGGED = "OK"
+COMMAND_DEVICE_NOT_FOUND = "NOT_FOUND"
+COMMAND_DEVICE_OFFLINE = "OFFLINE"
+
+# Checks that the device exists and is online, then logs the command, all in one atomic round trip.
+# The accepted "online" spellings must match redis_helper._ONLINE_TRUE_VALUES.
+# KEYS[1] = device hash, KEYS[2] = command history list
+# ARGV[1] = encoded command entry, ARGV[2] = last list index kept by LTRIM
+SEND_COMMAND_LUA = """
+local online = redis.call('HGET', KEYS[1], 'online')
+if not online then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 'NOT_FOUND'
+    end
+    online = 'false'
+end
+if online ~= 'true' and online ~= 'True' and online ~= 'TRUE' then
+    return 'OFFLINE'
+end
+redis.call('LPUSH', KEYS[2], ARGV[1])
+redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[2]))
+return 'OK'
+"""
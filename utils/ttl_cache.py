@@ -0,0 +1,48 @@
+# utils/ttl_cache.py
+import asyncio
+import time
+from typing import Awaitable, Callable, Generic, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class TTLCache(Generic[T]):
+    """
+    In-process cache for a single value that is reused for `ttl` seconds (a ttl <= 0 disables caching).
+    Refreshes are single-flight: concurrent misses wait on a lock and share one call to the loader.
+    Loader exceptions propagate and are not cached.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        # (expires_at on the monotonic clock, value); None when empty or invalidated
+        self._entry: Optional[Tuple[float, T]] = None
+        self._lock = asyncio.Lock()
+
+    def _fresh_entry(self) -> Optional[Tuple[float, T]]:
+        entry = self._entry
+        if entry is not None and entry[0] > time.monotonic():
+            return entry
+        return None
+
+    async def get(self, loader: Callable[[], Awaitable[T]]) -> T:
+        """Return the cached value, awaiting loader() to refresh it once it has expired."""
+        if self.ttl <= 0:
+            return await loader()
+
+        entry = self._fresh_entry()
+        if entry is not None:
+            return entry[1]
+
+        async with self._lock:
+            # Another request may have refreshed the cache while we waited for the lock
+            entry = self._fresh_entry()
+            if entry is not None:
+                return entry[1]
+            value = await loader()
+            self._entry = (time.monotonic() + self.ttl, value)
+            return value
+
+    def invalidate(self) -> None:
+        """Drop the cached value so the next get() calls the loader."""
+        self._entry = None